@@ -6,12 +6,24 @@ CFTC COT Report Data Fetcher
   核心关注：Leveraged Funds（杠杆资金/对冲基金）持仓
 """
 
+import glob
+import gzip
+import hashlib
 import json
+import multiprocessing as mp
 import os
+import random
+import re
+import sys
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from urllib.parse import urlparse
+import numpy as np
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 import cot_reports as cot
 import yfinance as yf
 import akshare as ak
@@ -68,6 +80,135 @@ TFF_COL_MAP = {
 # 输出路径
 OUTPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
 
+# 品种处理并行：进程数默认为 CPU 核数，可用环境变量 COT_WORKERS 覆盖（1 为顺序处理）。
+# 单个品种处理约 10-15 ms，进程池启动开销更大，品种数不少于该值时才启用（当前约 20 个品种均顺序处理）
+PARALLEL_MIN_TASKS = 32
+
+# 静态产物：内容哈希文件名 + gzip 预压缩，保留当前与上一版本供正在加载的客户端使用
+ARTIFACT_HASH_LEN = 12
+# 不参与内容哈希的易变字段（仅这些字段变化时不生成新版本）
+ARTIFACT_VOLATILE_KEYS = ("updated_at", "fetch_report")
+
+# ── HTTP 传输层配置 ───────────────────────────────────────────────────────────
+HTTP_RETRIES   = 3      # 失败后最多重试次数
+HTTP_BACKOFF   = 1.0    # 第 n 次重试前等待 HTTP_BACKOFF * 2^(n-1) 秒（含随机抖动）
+HTTP_POOL_SIZE = 8      # 每个主机的持久连接数（keep-alive）
+RETRY_STATUS   = {429, 500, 502, 503, 504}
+# 同一主机两次请求之间的最小间隔（秒），未列出的主机使用 DEFAULT_MIN_INTERVAL
+HOST_MIN_INTERVAL = {
+    "www.cmegroup.com":            1.0,
+    "www.cftc.gov":                0.5,
+    "finance.yahoo.com":           0.5,
+    "stock2.finance.sina.com.cn":  0.3,
+    "www.shfe.com.cn":             0.5,
+}
+DEFAULT_MIN_INTERVAL = 0.2
+
+# ── CME 结算价数据源 ──────────────────────────────────────────────────────────
+# 可通过环境变量指向本地桩服务器（测试用）
+CME_SETTLEMENTS_URL = os.environ.get(
+    "CME_SETTLEMENTS_URL",
+    "https://www.cmegroup.com/CmeWS/mvc/Settlements/futures/settlements",
+)
+CME_CACHE_DIR    = os.path.join(OUTPUT_DIR, "cme_settlements")
+CME_RECENT_DAYS  = 5      # 每次运行最多请求的最近工作日数（CME 只提供近几日结算价）
+CME_MIN_COVERAGE = 0.9    # 价差历史覆盖不足该比例时回退 yfinance
+
+
+# ── HTTP 传输层：连接池 + 按主机限速 + 指数退避重试 + 失败报告 ────────────────
+# 连接池会话只用于直接 HTTP 请求（CME）。yfinance 自带进程级单例会话（curl_cffi 浏览器
+# TLS 指纹模拟）并已复用连接，传入 requests.Session 会覆盖该会话，因此不接入；
+# AKShare 与 cot_reports 的接口不接受 session。这三类调用只经过 fetch_with_retry 的限速与重试。
+_http_session = None
+_session_lock = threading.Lock()
+_throttle_lock = threading.Lock()
+_host_next_slot = {}
+_failures_lock = threading.Lock()
+FETCH_FAILURES = []
+
+
+def get_http_session() -> requests.Session:
+    """返回共享的 requests.Session（连接池复用，避免每次请求重新握手）"""
+    global _http_session
+    with _session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({"User-Agent": "Mozilla/5.0"})
+            _http_session = session
+        return _http_session
+
+
+def _throttle(host: str):
+    """按主机限速：为本次请求预约时间片，必要时等待"""
+    interval = HOST_MIN_INTERVAL.get(host, DEFAULT_MIN_INTERVAL)
+    with _throttle_lock:
+        now  = time.monotonic()
+        slot = max(now, _host_next_slot.get(host, 0.0))
+        _host_next_slot[host] = slot + interval
+    if slot > now:
+        time.sleep(slot - now)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    """HTTP 4xx（429 除外）视为永久失败，其余异常均可重试"""
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code in RETRY_STATUS
+    return True
+
+
+def _is_empty(result) -> bool:
+    if result is None:
+        return True
+    if isinstance(result, pd.DataFrame):
+        return result.empty
+    return False
+
+
+def record_failure(label: str, error):
+    """记录一次最终失败的抓取，供运行结束时汇总"""
+    with _failures_lock:
+        FETCH_FAILURES.append({"target": label, "error": str(error)})
+
+
+def fetch_with_retry(fn, *args, host: str, label: str, retries: int = HTTP_RETRIES, **kwargs):
+    """
+    在限速与指数退避下调用抓取函数 fn(*args, **kwargs)。
+    返回 None / 空 DataFrame 视为失败并重试；重试耗尽后记入失败报告并返回 None。
+    """
+    last_err = None
+    for attempt in range(retries + 1):
+        _throttle(host)
+        try:
+            result = fn(*args, **kwargs)
+            if _is_empty(result):
+                raise ValueError("返回空数据")
+            return result
+        except Exception as e:
+            last_err = e
+            if attempt >= retries or not _is_retryable(e):
+                break
+            time.sleep(HTTP_BACKOFF * (2 ** attempt) * (1 + random.random() * 0.25))
+    record_failure(label, last_err)
+    return None
+
+
+def http_get_json(url: str, label: str, params: dict = None, timeout: int = 12):
+    """通过共享会话 GET 并解析 JSON，失败返回 None（已记入失败报告）"""
+    def _get():
+        resp = get_http_session().get(url, params=params, timeout=timeout)
+        resp.raise_for_status()
+        return resp.json()
+    return fetch_with_retry(_get, host=urlparse(url).netloc, label=label)
+
+
+def fetch_report() -> dict:
+    """汇总本次运行的抓取失败情况"""
+    with _failures_lock:
+        return {"failure_count": len(FETCH_FAILURES), "failures": list(FETCH_FAILURES)}
+
 
 def fetch_cot_data(years: list = None) -> pd.DataFrame:
     """获取 COT Disaggregated Futures + Options 报告数据"""
@@ -76,13 +217,14 @@ def fetch_cot_data(years: list = None) -> pd.DataFrame:
         years = [current_year - 3, current_year - 2, current_year - 1, current_year]
     all_data = []
     for year in years:
-        try:
-            print(f"  {year} 年...", end=" ")
-            df = cot.cot_year(year=year, cot_report_type="disaggregated_futopt")
-            all_data.append(df)
-            print("OK")
-        except Exception as e:
-            print(f"失败: {e}")
+        print(f"  {year} 年...", end=" ")
+        df = fetch_with_retry(cot.cot_year, year=year, cot_report_type="disaggregated_futopt",
+                              host="www.cftc.gov", label=f"COT {year}")
+        if df is None:
+            print("失败")
+            continue
+        all_data.append(df)
+        print("OK")
     if not all_data:
         raise ValueError("未能获取任何数据")
     return pd.concat(all_data, ignore_index=True)
@@ -95,31 +237,49 @@ def fetch_tff_data(years: list = None) -> pd.DataFrame:
         years = [current_year - 3, current_year - 2, current_year - 1, current_year]
     all_data = []
     for year in years:
-        try:
-            print(f"  {year} 年...", end=" ")
-            df = cot.cot_year(year=year, cot_report_type="traders_in_financial_futures_futopt")
-            all_data.append(df)
-            print("OK")
-        except Exception as e:
-            print(f"失败: {e}")
+        print(f"  {year} 年...", end=" ")
+        df = fetch_with_retry(cot.cot_year, year=year, cot_report_type="traders_in_financial_futures_futopt",
+                              host="www.cftc.gov", label=f"TFF {year}")
+        if df is None:
+            print("失败")
+            continue
+        all_data.append(df)
+        print("OK")
     if not all_data:
         raise ValueError("未能获取任何TFF数据")
     return pd.concat(all_data, ignore_index=True)
 
 
-def filter_commodity_data(df: pd.DataFrame, pattern: str) -> pd.DataFrame:
-    """根据正则表达式筛选特定品种数据"""
-    market_col = None
+def _find_market_col(df: pd.DataFrame) -> str:
     for col in df.columns:
         if 'market' in col.lower() and 'exchange' in col.lower():
-            market_col = col
-            break
-    if market_col is None:
-        raise ValueError("未找到市场名称列")
+            return col
+    raise ValueError("未找到市场名称列")
+
+
+def filter_commodity_data(df: pd.DataFrame, pattern: str) -> pd.DataFrame:
+    """根据正则表达式筛选特定品种数据"""
+    market_col = _find_market_col(df)
     mask = df[market_col].str.match(pattern, case=False, na=False)
     return df[mask].copy()
 
 
+def partition_by_market(df: pd.DataFrame, instruments: dict) -> dict:
+    """
+    按市场名称一次性分组，再将各品种的正则只匹配到唯一市场名上，
+    返回 {code: 子 DataFrame}（行顺序与 filter_commodity_data 一致）。
+    """
+    market_col = _find_market_col(df)
+    groups = df.groupby(market_col, sort=False).indices
+    parts = {}
+    for code, config in instruments.items():
+        regex = re.compile(config['pattern'], re.IGNORECASE)
+        matched = [groups[name] for name in groups if isinstance(name, str) and regex.match(name)]
+        rows = np.sort(np.concatenate(matched)) if matched else np.array([], dtype=int)
+        parts[code] = df.iloc[rows].copy()
+    return parts
+
+
 def get_column_value(row, possible_names, default=0):
     """从多个可能的列名中获取值"""
     for name in possible_names:
@@ -224,14 +384,86 @@ def calculate_summary(records: list) -> dict:
     }
 
 
+# fork 出的工作进程通过写时复制直接读取这两个变量，无需序列化传递 DataFrame
+_WORKER_PARTS = {}
+_WORKER_RAW = None
+
+
+def _process_instrument(task):
+    """处理单个品种，返回 (code, records, summary, error)"""
+    code, pattern, weeks, col_map = task
+    try:
+        if code in _WORKER_PARTS:
+            df = _WORKER_PARTS[code]
+        else:
+            df = filter_commodity_data(_WORKER_RAW, pattern)
+        if df.empty:
+            return code, None, None, "未找到数据"
+        records = process_commodity_data(df, weeks=weeks, col_map=col_map)
+        if not records:
+            return code, None, None, "处理失败"
+        return code, records, calculate_summary(records), None
+    except Exception as e:
+        return code, None, None, f"错误: {e}"
+
+
+def _worker_count() -> int:
+    """读取 COT_WORKERS（默认 CPU 核数），无效值回退为顺序执行"""
+    raw = os.environ.get("COT_WORKERS", "").strip()
+    if not raw:
+        return os.cpu_count() or 1
+    try:
+        return max(int(raw), 1)
+    except ValueError:
+        print(f"  警告: COT_WORKERS={raw!r} 无效，改为顺序处理")
+        return 1
+
+
+def process_instruments(raw_df: pd.DataFrame, instruments: dict, weeks: int = 156,
+                        col_map: dict = None, workers: int = None) -> list:
+    """
+    批量处理品种：先按市场分组一次，品种数达到 PARALLEL_MIN_TASKS 时分发到进程池并行处理。
+    返回与 instruments 顺序一致的 [(code, records, summary, error), ...]。
+    仅在 Linux 上使用 fork（macOS 上 fork 已加载系统框架的进程不安全）；
+    分组失败时逐品种筛选，进程池异常时回退顺序处理，单个品种的错误只影响该品种。
+    """
+    global _WORKER_PARTS, _WORKER_RAW
+    if workers is None:
+        workers = _worker_count()
+    tasks = [(code, config['pattern'], weeks, col_map) for code, config in instruments.items()]
+    _WORKER_RAW = raw_df
+    try:
+        _WORKER_PARTS = partition_by_market(raw_df, instruments)
+    except Exception as e:
+        print(f"  按市场分组失败（{e}），逐品种筛选")
+        _WORKER_PARTS = {}
+    try:
+        if (workers > 1 and _WORKER_PARTS and len(tasks) >= PARALLEL_MIN_TASKS
+                and sys.platform.startswith("linux")):
+            try:
+                with ProcessPoolExecutor(max_workers=min(workers, len(tasks)),
+                                         mp_context=mp.get_context("fork")) as pool:
+                    return list(pool.map(_process_instrument, tasks))
+            except Exception as e:
+                print(f"  进程池失败（{e}），改为顺序处理")
+        return [_process_instrument(task) for task in tasks]
+    finally:
+        _WORKER_PARTS = {}
+        _WORKER_RAW = None
+
+
 def fetch_gvz_data(start_year: int = 2023) -> list:
     """获取 GVZ 黄金波动率指数 与 GLD 周成交量"""
     print("\n正在获取 GVZ 与 GLD 成交量数据...")
     start = f"{start_year}-01-01"
-    gvz_df = yf.download("^GVZ", start=start, auto_adjust=True, progress=False)
-    gld_df = yf.download("GLD",  start=start, auto_adjust=True, progress=False)
-
-    if gvz_df.empty:
+    gvz_df = fetch_with_retry(yf.download, "^GVZ", start=start, auto_adjust=True, progress=False,
+                              host="finance.yahoo.com", label="GVZ")
+    gld_df = fetch_with_retry(yf.download, "GLD",  start=start, auto_adjust=True, progress=False,
+                              host="finance.yahoo.com", label="GLD")
+    if gld_df is None:
+        gld_df = pd.DataFrame()
+
+    if gvz_df is None:
         print("  警告: GVZ 数据获取失败")
         return []
 
@@ -291,20 +523,17 @@ def get_copper_contract(date: datetime, offset: int = 0):
         y, m = _next_month(y, m)
 
 
-def _fetch_cme_settlements(trade_date_str: str) -> list:
-    """从 CME 公开 API 获取指定日期的铜期货结算价列表"""
-    url = (
-        f"https://www.cmegroup.com/CmeWS/mvc/Settlements/futures/settlements"
-        f"/HG/future?tradeDate={trade_date_str}&version=final"
-    )
-    headers = {"User-Agent": "Mozilla/5.0"}
-    try:
-        resp = requests.get(url, headers=headers, timeout=12)
-        if resp.status_code != 200:
-            return []
-        return resp.json().get("settlements", [])
-    except Exception:
-        return []
+def _fetch_cme_settlements(trade_date_str: str):
+    """
+    从 CME 公开 API 获取指定日期（MM/DD/YYYY）的铜期货结算价列表。
+    请求失败返回 None；当日无结算数据返回空列表。
+    """
+    url = f"{CME_SETTLEMENTS_URL}/HG/future"
+    payload = http_get_json(url, label=f"CME HG settlements {trade_date_str}",
+                            params={"tradeDate": trade_date_str, "version": "final"})
+    if payload is None:
+        return None
+    return payload.get("settlements", [])
 
 
 def _parse_settle(val: str):
@@ -317,6 +546,160 @@ def _parse_settle(val: str):
         return None
 
 
+_CME_MONTHS = {"JAN": 1, "FEB": 2, "MAR": 3, "APR": 4, "MAY": 5, "JUN": 6, "JUL": 7, "JLY": 7,
+               "AUG": 8, "SEP": 9, "OCT": 10, "NOV": 11, "DEC": 12}
+
+
+def _parse_cme_month(label: str):
+    """将 CME 合约月份标签（如 'DEC 26'）解析为 (year, month)，失败返回 None"""
+    parts = (label or "").strip().upper().split()
+    if len(parts) != 2 or parts[0] not in _CME_MONTHS or not parts[1].isdigit():
+        return None
+    year = int(parts[1])
+    if year < 100:
+        year += 2000
+    return year, _CME_MONTHS[parts[0]]
+
+
+def load_cme_settlements(trade_date: datetime, offline: bool = False):
+    """
+    读取指定交易日的 HG 结算价，优先使用本地缓存（data/cme_settlements/）。
+    只缓存非空结果：空结果可能是尚未发布、非交易日或已超出 CME 的可查询范围，
+    无法区分，因此不落盘。
+    请求失败或 offline=True 且无缓存时返回 None。
+    """
+    fp = os.path.join(CME_CACHE_DIR, f"HG_{trade_date.strftime('%Y-%m-%d')}.json")
+    if os.path.exists(fp):
+        try:
+            with open(fp, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+    if offline:
+        return None
+
+    settlements = _fetch_cme_settlements(trade_date.strftime("%m/%d/%Y"))
+    if settlements:
+        os.makedirs(CME_CACHE_DIR, exist_ok=True)
+        with open(fp, "w", encoding="utf-8") as f:
+            json.dump(settlements, f, ensure_ascii=False)
+    return settlements
+
+
+def _settlements_to_strip(settlements: list, trade_date: datetime) -> list:
+    """将某交易日的结算价列表转为按到期排序的期货曲线（剔除已到期与无价合约）"""
+    MONTH_CODES = {1: 'F', 2: 'G', 3: 'H', 4: 'J', 5: 'K', 6: 'M',
+                   7: 'N', 8: 'Q', 9: 'U', 10: 'V', 11: 'X', 12: 'Z'}
+    strip = []
+    for item in settlements or []:
+        ym = _parse_cme_month(item.get("month", ""))
+        if ym is None:
+            continue
+        y, m = ym
+        if datetime(y, m, 25) <= trade_date:   # 与 get_copper_contract 一致，以 25 日为到期日
+            continue
+        price = _parse_settle(item.get("settle", ""))
+        if price is None or price <= 0:
+            continue
+        strip.append({
+            "month":    f"{y}-{m:02d}",
+            "price":    round(price, 4),
+            "contract": f"HG{MONTH_CODES[m]}{str(y)[-2:]}",
+        })
+    strip.sort(key=lambda x: x["month"])
+    return strip
+
+
+def _strip_spread_point(date: datetime, strip: list):
+    """由合约曲线计算季度合约（H/K/N/U/Z）M1-M3 价差，不足两个季度合约返回 None"""
+    QUARTERLY = {3, 5, 7, 9, 12}
+    quarterly = [c for c in strip if int(c["month"][-2:]) in QUARTERLY]
+    if len(quarterly) < 2:
+        return None
+    m1 = quarterly[0]
+    m3 = quarterly[2] if len(quarterly) >= 3 else quarterly[-1]
+    return {
+        "date":        date.strftime("%Y-%m-%d"),
+        "m1_price":    m1["price"],
+        "m3_price":    m3["price"],
+        "m1_contract": m1["contract"],
+        "m3_contract": m3["contract"],
+        "spread":      round(m1["price"] - m3["price"], 4)
+    }
+
+
+def _load_week_strip(friday: datetime) -> list:
+    """从缓存取某周五（遇假日则回退至周四、周三）的结算价曲线"""
+    for back in range(3):
+        day = friday - timedelta(days=back)
+        strip = _settlements_to_strip(load_cme_settlements(day, offline=True), day)
+        if strip:
+            return strip
+    return []
+
+
+def fetch_copper_curve_from_settlements(weeks: int = 156, existing_history: list = None) -> dict:
+    """
+    基于 CME 结算价构建 COMEX 铜期限结构：
+    - snapshot ：最近一个有结算价的交易日的完整 HG 合约曲线（一次请求）
+    - spread_history：每周五的季度合约 M1-M3 价差
+    CME 公开接口只提供最近几个交易日的结算价，无法回补历史。因此每次运行只请求
+    最近 CME_RECENT_DAYS 个工作日（已缓存的日期不再请求），价差历史由上次输出的
+    existing_history 与本地缓存逐周累积而成。首个请求失败即视为 CME 不可达，
+    其余日期只读缓存。
+    价格单位：USD/lb
+    """
+    print("\n正在通过 CME 结算价获取 COMEX 铜期限结构...")
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    # ── 快照：最近几个工作日中最新一个有结算价的交易日 ────────────────────────
+    snapshot = []
+    reachable = True
+    day = today
+    for _ in range(CME_RECENT_DAYS):
+        while day.weekday() >= 5:
+            day -= timedelta(days=1)
+        settlements = load_cme_settlements(day, offline=not reachable)
+        if settlements is None and reachable:
+            reachable = False
+            print("  CME 不可达，仅使用本地缓存")
+        if not snapshot:
+            snapshot = _settlements_to_strip(settlements, day)[:12]
+        day -= timedelta(days=1)
+
+    # ── 价差历史：上次输出 + 缓存中的周五结算价（缓存优先）────────────────────
+    fridays = pd.date_range(end=pd.Timestamp(today), periods=weeks, freq="W-FRI")
+    history = {r["date"]: r for r in existing_history or []}
+    for friday in fridays:
+        point = _strip_spread_point(friday, _load_week_strip(friday.to_pydatetime()))
+        if point:
+            history[point["date"]] = point
+    start = fridays[0].strftime("%Y-%m-%d")
+    spread_history = [history[d] for d in sorted(history) if d >= start]
+
+    print(f"  成功: 快照 {len(snapshot)} 个合约, 历史价差 {len(spread_history)} 周")
+    return {"snapshot": snapshot, "spread_history": spread_history}
+
+
+def build_copper_curve(weeks: int = 156, existing_history: list = None) -> dict:
+    """
+    COMEX 铜期限结构：优先使用 CME 结算价（每个交易日一次请求 + 本地缓存），
+    快照缺失或价差历史覆盖不足（如首次运行）时回退 yfinance，并按日期合并
+    （结算价与已有历史优先）。
+    """
+    curve = fetch_copper_curve_from_settlements(weeks=weeks, existing_history=existing_history)
+    if curve["snapshot"] and len(curve["spread_history"]) >= weeks * CME_MIN_COVERAGE:
+        return curve
+
+    fallback = fetch_copper_curve_data(weeks=weeks)
+    merged = {r["date"]: r for r in fallback["spread_history"]}
+    merged.update({r["date"]: r for r in curve["spread_history"]})
+    return {
+        "snapshot":       curve["snapshot"] or fallback["snapshot"],
+        "spread_history": [merged[d] for d in sorted(merged)],
+    }
+
+
 def fetch_copper_curve_data(weeks: int = 156) -> dict:
     """
     获取 COMEX 铜期货期限结构数据：
@@ -343,8 +726,9 @@ def fetch_copper_curve_data(weeks: int = 156) -> dict:
     tickers_list = [s["ticker"] for s in snapshot_meta]
     snapshot = []
     try:
-        raw = yf.download(tickers_list, period="5d", auto_adjust=True, progress=False)
-        if not raw.empty:
+        raw = fetch_with_retry(yf.download, tickers_list, period="5d", auto_adjust=True, progress=False,
+                               host="finance.yahoo.com", label="COMEX 铜快照")
+        if raw is not None:
             if isinstance(raw.columns, pd.MultiIndex):
                 close_df = raw["Close"].copy()
             else:
@@ -385,9 +769,10 @@ def fetch_copper_curve_data(weeks: int = 156) -> dict:
 
     spread_history = []
     try:
-        hist_raw = yf.download(qtickers, start=start_date, auto_adjust=True, progress=False)
+        hist_raw = fetch_with_retry(yf.download, qtickers, start=start_date, auto_adjust=True, progress=False,
+                                    host="finance.yahoo.com", label="COMEX 铜季度合约历史")
 
-        if not hist_raw.empty:
+        if hist_raw is not None:
             if isinstance(hist_raw.columns, pd.MultiIndex):
                 hist_close = hist_raw["Close"].copy()
             else:
@@ -484,18 +869,17 @@ def fetch_shfe_copper_data(existing_inventory: list = None) -> dict:
         y, m = _next_month(y, m)
 
     for item in snapshot_codes:
-        try:
-            df = ak.futures_zh_daily_sina(symbol=item['code'])
-            if df is not None and not df.empty:
-                price = float(df['close'].iloc[-1])
-                if price > 0:
-                    snapshot.append({
-                        "month":    item['month'],
-                        "price":    price,
-                        "contract": item['code']
-                    })
-        except Exception:
-            pass
+        df = fetch_with_retry(ak.futures_zh_daily_sina, symbol=item['code'],
+                              host="stock2.finance.sina.com.cn", label=f"沪铜快照 {item['code']}")
+        if df is None:
+            continue
+        price = float(df['close'].iloc[-1])
+        if price > 0:
+            snapshot.append({
+                "month":    item['month'],
+                "price":    price,
+                "contract": item['code']
+            })
     snapshot.sort(key=lambda x: x['month'])
     print(f"  快照: {len(snapshot)} 个合约")
 
@@ -521,17 +905,19 @@ def fetch_shfe_copper_data(existing_inventory: list = None) -> dict:
     print(f"  下载 {len(quarterly_meta)} 个季度合约历史...")
     price_cache = {}
     for q in quarterly_meta:
-        try:
-            df = ak.futures_zh_daily_sina(symbol=q['code'])
-            if df is not None and not df.empty:
-                df['date'] = pd.to_datetime(df['date'])
-                price_cache[q['code']] = {
-                    "series":    df.set_index('date')['close'],
-                    "last_date": pd.Timestamp(df['date'].max()),
-                    "delivery":  q['delivery']
-                }
-        except Exception:
-            pass
+        # 尚未上市的远月合约没有数据属正常情况，不重试也不记为失败
+        if q['delivery'] > today + timedelta(days=365):
+            continue
+        df = fetch_with_retry(ak.futures_zh_daily_sina, symbol=q['code'],
+                              host="stock2.finance.sina.com.cn", label=f"沪铜季度合约 {q['code']}")
+        if df is None:
+            continue
+        df['date'] = pd.to_datetime(df['date'])
+        price_cache[q['code']] = {
+            "series":    df.set_index('date')['close'],
+            "last_date": pd.Timestamp(df['date'].max()),
+            "delivery":  q['delivery']
+        }
     print(f"  成功获取 {len(price_cache)} 个合约数据")
 
     spread_history = []
@@ -585,7 +971,10 @@ def fetch_shfe_copper_data(existing_inventory: list = None) -> dict:
     # ── 3. 注册仓单（库存）：追加当周数据 ─────────────────────────────────────
     inventory_history = list(existing_inventory)
     try:
-        wh    = ak.futures_shfe_warehouse_receipt()
+        wh = fetch_with_retry(ak.futures_shfe_warehouse_receipt,
+                              host="www.shfe.com.cn", label="沪铜注册仓单")
+        if wh is None:
+            raise ValueError("仓单接口无数据")
         cu_wh = wh.get('铜', pd.DataFrame())
         if not cu_wh.empty:
             # 取"总计"行（WHABBRNAME='总计'），避免对小计行重复累加
@@ -630,19 +1019,166 @@ def save_to_json(data: dict, filename: str = "cot_data.json"):
     return filepath
 
 
+def _artifact_hash(data: dict) -> str:
+    stable = {k: v for k, v in data.items() if k not in ARTIFACT_VOLATILE_KEYS}
+    raw = json.dumps(stable, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:ARTIFACT_HASH_LEN]
+
+
+# 按品种增量更新的分组（其余顶层字段变化时整体替换）
+DELTA_INSTRUMENT_KEYS = ("commodities", "tff_instruments")
+
+
+def build_delta(old: dict, new: dict) -> dict:
+    """
+    计算两个版本之间的增量：
+    - 品种分组：仅包含有变化的品种，weekly_data 只给出新增/变化的周（按 date 合并），
+      weekly_len 用于客户端截断滑出窗口的旧周
+    - 其他顶层字段：有变化则整体替换
+    """
+    delta = {"instruments": {}, "removed": {}, "replace": {}}
+    for key in DELTA_INSTRUMENT_KEYS:
+        old_group, new_group = old.get(key, {}), new.get(key, {})
+        changed = {}
+        for code, item in new_group.items():
+            prev = old_group.get(code)
+            if prev == item:
+                continue
+            prev_weeks = {r["date"]: r for r in (prev or {}).get("weekly_data", [])}
+            entry = {k: v for k, v in item.items() if k != "weekly_data"}
+            entry["weekly_upsert"] = [r for r in item.get("weekly_data", []) if prev_weeks.get(r["date"]) != r]
+            entry["weekly_len"] = len(item.get("weekly_data", []))
+            changed[code] = entry
+        delta["instruments"][key] = changed
+        delta["removed"][key] = [code for code in old_group if code not in new_group]
+    for key, value in new.items():
+        if key not in DELTA_INSTRUMENT_KEYS and old.get(key) != value:
+            delta["replace"][key] = value
+    return delta
+
+
+def apply_delta(old: dict, delta: dict) -> dict:
+    """将 build_delta 的结果应用到旧版本上（与 dashboard.html 中 applyDelta 逻辑一致）"""
+    data = {k: v for k, v in old.items() if k not in DELTA_INSTRUMENT_KEYS}
+    for key in DELTA_INSTRUMENT_KEYS:
+        group = dict(old.get(key, {}))
+        for code in delta["removed"].get(key, []):
+            group.pop(code, None)
+        for code, entry in delta["instruments"].get(key, {}).items():
+            weeks = {r["date"]: r for r in group.get(code, {}).get("weekly_data", [])}
+            weeks.update({r["date"]: r for r in entry["weekly_upsert"]})
+            merged = [weeks[d] for d in sorted(weeks)]
+            item = {k: v for k, v in entry.items() if k not in ("weekly_upsert", "weekly_len")}
+            item["weekly_data"] = merged[-entry["weekly_len"]:] if entry["weekly_len"] else []
+            group[code] = item
+        if key in old or group:
+            data[key] = group
+    data.update(delta["replace"])
+    return data
+
+
+def write_static_artifacts(data: dict, basename: str = "cot_data") -> dict:
+    """
+    生成内容哈希命名的静态产物及索引文件，供仪表盘长期缓存：
+    - {basename}.{hash}.json / .json.gz（紧凑 JSON + gzip 预压缩，仪表盘在浏览器端解压；
+      raw.githubusercontent 不按 Content-Encoding 提供文件，因此不生成 brotli 版本）
+    - {basename}.index.json：指向当前版本，体积小，客户端每次访问时校验
+    - {basename}.delta.{上一哈希}-{哈希}.json：相对上一版本的增量，供已缓存旧版本的客户端使用
+    数据内容（不含 ARTIFACT_VOLATILE_KEYS）未变化时沿用已有文件，URL 保持不变。
+    """
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    index_fp = os.path.join(OUTPUT_DIR, f"{basename}.index.json")
+    old_index = {}
+    if os.path.exists(index_fp):
+        try:
+            with open(index_fp, "r", encoding="utf-8") as f:
+                old_index = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    digest = _artifact_hash(data)
+    name   = f"{basename}.{digest}.json"
+    fp     = os.path.join(OUTPUT_DIR, name)
+    # 版本变化（含回滚到已有文件）时重新生成增量；索引只公布指向当前哈希的增量
+    if digest != old_index.get("hash"):
+        delta_info = _write_delta(old_index, data, digest, basename)
+    else:
+        delta_info = old_index.get("delta")
+    if delta_info and delta_info.get("hash") != digest:
+        delta_info = None
+    if not os.path.exists(fp):
+        raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        with open(fp, "wb") as f:
+            f.write(raw)
+        with open(fp + ".gz", "wb") as f:
+            f.write(gzip.compress(raw, compresslevel=9, mtime=0))
+
+    encodings = ["gzip"]
+    index = {
+        "updated_at": data.get("updated_at", ""),
+        "hash":       digest,
+        "file":       name,
+        "size":       os.path.getsize(fp),
+        "encodings":  encodings,
+        "previous":   old_index.get("file") if old_index.get("file") != name else old_index.get("previous"),
+        "delta":      delta_info,
+    }
+    with open(index_fp, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+
+    # 清理过期版本，只保留当前与上一版本
+    keep = {name, index["previous"], (delta_info or {}).get("file")}
+    for old_fp in glob.glob(os.path.join(OUTPUT_DIR, f"{basename}.*.json*")):
+        old_name = os.path.basename(old_fp)
+        if old_name == os.path.basename(index_fp):
+            continue
+        if old_name.split(".json")[0] + ".json" not in keep:
+            os.remove(old_fp)
+
+    print(f"静态产物: {name} ({', '.join(encodings)})")
+    return index
+
+
+def _write_delta(old_index: dict, data: dict, digest: str, basename: str):
+    """基于上一版本的哈希文件生成增量文件，返回索引中的 delta 描述；无法生成时返回 None"""
+    base_hash = old_index.get("hash")
+    old_fp = os.path.join(OUTPUT_DIR, old_index.get("file") or "")
+    if not base_hash or not os.path.isfile(old_fp):
+        return None
+    try:
+        with open(old_fp, "r", encoding="utf-8") as f:
+            old = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    delta = build_delta(old, data)
+    # 自校验：增量应用后必须与新版本一致，否则客户端回退全量下载
+    if apply_delta(old, delta) != data:
+        print("  增量校验失败，跳过增量文件")
+        return None
+    delta.update({"base": base_hash, "hash": digest})
+    name = f"{basename}.delta.{base_hash}-{digest}.json"
+    fp   = os.path.join(OUTPUT_DIR, name)
+    with open(fp, "w", encoding="utf-8") as f:
+        json.dump(delta, f, ensure_ascii=False, separators=(",", ":"))
+    return {"file": name, "base": base_hash, "hash": digest, "size": os.path.getsize(fp)}
+
+
 def main():
     print("=" * 55)
     print("CFTC COT 数据获取程序")
     print("=" * 55)
 
-    # 读取已有 JSON（保留沪铜仓单历史，避免每次覆盖）
+    # 读取已有 JSON（保留沪铜仓单与 COMEX 铜价差历史，避免每次覆盖）
     existing_fp = os.path.join(OUTPUT_DIR, "cot_data.json")
     existing_shfe_inventory = []
+    existing_copper_history = []
     if os.path.exists(existing_fp):
         try:
             with open(existing_fp, "r", encoding="utf-8") as f:
                 old = json.load(f)
             existing_shfe_inventory = old.get("shfe_copper", {}).get("inventory_history", [])
+            existing_copper_history = old.get("copper_curve", {}).get("spread_history", [])
         except Exception:
             pass
 
@@ -662,25 +1198,18 @@ def main():
     print(f"  共 {len(raw_df)} 条原始记录")
 
     print("\n[2/6] 处理商品品种...")
-    for code, config in COMMODITIES.items():
+    for code, records, summary, error in process_instruments(raw_df, COMMODITIES, weeks=156):
+        config = COMMODITIES[code]
         print(f"  {config['name']} ({code})...", end=" ")
-        try:
-            commodity_df = filter_commodity_data(raw_df, config['pattern'])
-            if commodity_df.empty:
-                print("未找到数据")
-                continue
-            records = process_commodity_data(commodity_df, weeks=156)
-            if not records:
-                print("处理失败")
-                continue
-            result["commodities"][code] = {
-                "name": config['name'], "name_en": config['name_en'],
-                "summary": calculate_summary(records), "weekly_data": records
-            }
-            result["commodity_list"].append({"code": code, "name": config['name'], "name_en": config['name_en']})
-            print(f"{len(records)} 周")
-        except Exception as e:
-            print(f"错误: {e}")
+        if error:
+            print(error)
+            continue
+        result["commodities"][code] = {
+            "name": config['name'], "name_en": config['name_en'],
+            "summary": summary, "weekly_data": records
+        }
+        result["commodity_list"].append({"code": code, "name": config['name'], "name_en": config['name_en']})
+        print(f"{len(records)} 周")
 
     # ── 2. TFF 外汇 & 加密数据 ─────────────────────────────────────────────
     print("\n[3/6] 获取 TFF 数据（外汇 & 加密货币）...")
@@ -688,31 +1217,25 @@ def main():
         tff_raw = fetch_tff_data()
         print(f"  共 {len(tff_raw)} 条原始记录")
 
-        for code, config in FX_INSTRUMENTS.items():
+        for code, records, summary, error in process_instruments(tff_raw, FX_INSTRUMENTS, weeks=156,
+                                                                 col_map=TFF_COL_MAP):
+            config = FX_INSTRUMENTS[code]
             print(f"  {config['name']} ({code})...", end=" ")
-            try:
-                inst_df = filter_commodity_data(tff_raw, config['pattern'])
-                if inst_df.empty:
-                    print("未找到数据")
-                    continue
-                records = process_commodity_data(inst_df, weeks=156, col_map=TFF_COL_MAP)
-                if not records:
-                    print("处理失败")
-                    continue
-                result["tff_instruments"][code] = {
-                    "name": config['name'], "name_en": config['name_en'],
-                    "summary": calculate_summary(records), "weekly_data": records
-                }
-                result["tff_instrument_list"].append({"code": code, "name": config['name'], "name_en": config['name_en']})
-                print(f"{len(records)} 周")
-            except Exception as e:
-                print(f"错误: {e}")
+            if error:
+                print(error)
+                continue
+            result["tff_instruments"][code] = {
+                "name": config['name'], "name_en": config['name_en'],
+                "summary": summary, "weekly_data": records
+            }
+            result["tff_instrument_list"].append({"code": code, "name": config['name'], "name_en": config['name_en']})
+            print(f"{len(records)} 周")
     except Exception as e:
         print(f"  TFF数据获取失败: {e}")
 
     # ── 3. COMEX 铜期货期限结构 ────────────────────────────────────────────
     print("\n[4/6] 获取 COMEX 铜期货期限结构...")
-    result["copper_curve"] = fetch_copper_curve_data(weeks=156)
+    result["copper_curve"] = build_copper_curve(weeks=156, existing_history=existing_copper_history)
 
     # ── 4. 沪铜（SHFE）期货数据 ───────────────────────────────────────────
     print("\n[5/6] 获取沪铜（SHFE）期货数据...")
@@ -737,10 +1260,16 @@ def main():
 
     # ── 6. 保存 ────────────────────────────────────────────────────────────
     print("\n[6/6] 保存数据...")
+    result["fetch_report"] = fetch_report()
     save_to_json(result)
+    write_static_artifacts(result)
 
     print("\n" + "=" * 55)
     print(f"商品品种: {len(result['commodity_list'])} 个  |  TFF品种: {len(result['tff_instrument_list'])} 个")
+    if FETCH_FAILURES:
+        print(f"抓取失败: {len(FETCH_FAILURES)} 项（已写入 fetch_report）")
+        for item in FETCH_FAILURES:
+            print(f"  - {item['target']}: {item['error']}")
     print("=" * 55)
 
 
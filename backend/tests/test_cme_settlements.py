@@ -0,0 +1,160 @@
+"""CME 结算价曲线构建测试（本地桩服务器模拟 CME 接口）"""
+
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import cftc_data_fetcher as f
+
+
+STRIP = [
+    {"month": "OCT 26", "settle": "4.9000"},
+    {"month": "DEC 26", "settle": "5.1000"},
+    {"month": "JAN 27", "settle": "5.1200"},
+    {"month": "MAR 27", "settle": "5.1500"},
+    {"month": "MAY 27", "settle": "5.2000"},
+    {"month": "JLY 27", "settle": "5.2500"},
+    {"month": "SEP 27", "settle": "-"},
+    {"month": "Total",  "settle": ""},
+]
+
+
+def recent_strip():
+    """以当前日期生成未来 12 个月的结算价，避免测试随时间过期"""
+    months = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JLY", "AUG", "SEP", "OCT", "NOV", "DEC"]
+    strip = []
+    for i in range(12):
+        _, y, m = f.get_copper_contract(datetime.now(), offset=i)
+        strip.append({"month": f"{months[m - 1]} {str(y)[-2:]}", "settle": f"{5 + i * 0.01:.4f}"})
+    return strip + [{"month": "Total", "settle": ""}]
+
+
+class StubCME:
+    """只返回最近 served_days 天结算价的桩服务器，与 CME 公开接口行为一致"""
+
+    def __init__(self, served_days=5):
+        self.served_days = served_days
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                trade_date = datetime.strptime(query["tradeDate"][0], "%m/%d/%Y")
+                stub.requests.append(trade_date)
+                recent = (datetime.now() - trade_date).days < stub.served_days
+                body = json.dumps({"settlements": recent_strip() if recent else []}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/settlements"
+
+
+@pytest.fixture
+def stub(monkeypatch, tmp_path):
+    server = StubCME()
+    monkeypatch.setattr(f, "CME_SETTLEMENTS_URL", server.url)
+    monkeypatch.setattr(f, "CME_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(f, "DEFAULT_MIN_INTERVAL", 0)
+    monkeypatch.setattr(f, "FETCH_FAILURES", [])
+    yield server
+    server.server.shutdown()
+
+
+def test_parse_cme_month():
+    assert f._parse_cme_month("DEC 26") == (2026, 12)
+    assert f._parse_cme_month("jly 27") == (2027, 7)
+    assert f._parse_cme_month("JUL 2027") == (2027, 7)
+    assert f._parse_cme_month("Total") is None
+    assert f._parse_cme_month("") is None
+
+
+def test_settlements_to_strip_filters_expired_and_unpriced():
+    strip = f._settlements_to_strip(STRIP, datetime(2026, 10, 26))
+    assert [c["contract"] for c in strip] == ["HGZ26", "HGF27", "HGH27", "HGK27", "HGN27"]
+    assert strip[0] == {"month": "2026-12", "price": 5.1, "contract": "HGZ26"}
+
+
+def test_strip_spread_point_uses_quarterly_contracts():
+    strip = f._settlements_to_strip(STRIP, datetime(2026, 10, 26))
+    point = f._strip_spread_point(datetime(2026, 10, 30), strip)
+    assert point["m1_contract"] == "HGZ26"
+    assert point["m3_contract"] == "HGK27"
+    assert point["spread"] == pytest.approx(-0.1)
+
+
+def test_strip_spread_point_needs_two_quarterly_contracts():
+    strip = f._settlements_to_strip(STRIP[:3], datetime(2026, 10, 26))
+    assert f._strip_spread_point(datetime(2026, 10, 30), strip) is None
+
+
+def test_empty_settlements_are_not_cached(stub, tmp_path):
+    old_day = datetime.now() - timedelta(days=30)
+    assert f.load_cme_settlements(old_day) == []
+    assert os.listdir(tmp_path) == []
+    assert f.load_cme_settlements(old_day) == []
+    assert len(stub.requests) == 2
+
+
+def test_curve_requests_only_recent_days_and_uses_cache(stub):
+    curve = f.fetch_copper_curve_from_settlements(weeks=8)
+    assert curve["snapshot"]
+    assert len(stub.requests) <= f.CME_RECENT_DAYS
+
+    before = len(stub.requests)
+    again = f.fetch_copper_curve_from_settlements(weeks=8)
+    assert again["snapshot"] == curve["snapshot"]
+    # 已缓存的日期不再请求，只会重试无数据的日期
+    assert len(stub.requests) - before < f.CME_RECENT_DAYS
+    assert f.FETCH_FAILURES == []
+
+
+def test_curve_extends_existing_history(stub):
+    existing = [{"date": "2000-01-07", "spread": 0.0}]
+    fridays = f.pd.date_range(end=f.pd.Timestamp(datetime.now()), periods=8, freq="W-FRI")
+    existing += [{"date": d.strftime("%Y-%m-%d"), "spread": 0.0} for d in fridays[:-1]]
+    curve = f.fetch_copper_curve_from_settlements(weeks=8, existing_history=existing)
+    dates = [r["date"] for r in curve["spread_history"]]
+    assert dates == sorted(dates)
+    assert "2000-01-07" not in dates    # 超出窗口的旧周被截断
+    assert len(dates) >= 7
+
+
+def test_build_copper_curve_merges_fallback(stub, monkeypatch):
+    fridays = [d.strftime("%Y-%m-%d") for d in
+               f.pd.date_range(end=f.pd.Timestamp(datetime.now()), periods=8, freq="W-FRI")]
+    calls = []
+
+    def fake_yfinance(weeks):
+        calls.append(weeks)
+        return {"snapshot": [{"month": "x"}],
+                "spread_history": [{"date": d, "spread": 1.0} for d in fridays[:2]]}
+
+    monkeypatch.setattr(f, "fetch_copper_curve_data", fake_yfinance)
+    existing = [{"date": fridays[1], "spread": 2.0}]
+    curve = f.build_copper_curve(weeks=8, existing_history=existing)
+    assert calls == [8]
+    history = {r["date"]: r["spread"] for r in curve["spread_history"]}
+    assert history[fridays[0]] == 1.0
+    assert history[fridays[1]] == 2.0     # 已有历史优先于 yfinance
+    assert curve["snapshot"][0]["contract"].startswith("HG")
+
+
+def test_build_copper_curve_skips_fallback_when_covered(stub, monkeypatch):
+    monkeypatch.setattr(f, "fetch_copper_curve_data", lambda weeks: pytest.fail("不应回退 yfinance"))
+    fridays = f.pd.date_range(end=f.pd.Timestamp(datetime.now()), periods=8, freq="W-FRI")
+    existing = [{"date": d.strftime("%Y-%m-%d"), "spread": 0.0} for d in fridays]
+    curve = f.build_copper_curve(weeks=8, existing_history=existing)
+    assert len(curve["spread_history"]) == 8
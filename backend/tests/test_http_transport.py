@@ -0,0 +1,47 @@
+"""HTTP 传输层（限速 + 重试 + 失败报告）测试"""
+
+import pandas as pd
+import pytest
+
+import cftc_data_fetcher as f
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(f, "HTTP_BACKOFF", 0)
+    monkeypatch.setattr(f, "DEFAULT_MIN_INTERVAL", 0)
+    monkeypatch.setattr(f, "HOST_MIN_INTERVAL", {})
+    monkeypatch.setattr(f, "FETCH_FAILURES", [])
+
+
+def test_retries_empty_result_then_succeeds():
+    results = [pd.DataFrame(), pd.DataFrame({"a": [1]})]
+    df = f.fetch_with_retry(lambda: results.pop(0), host="example", label="x")
+    assert list(df["a"]) == [1]
+    assert f.FETCH_FAILURES == []
+
+
+def test_exhausted_retries_are_reported():
+    calls = []
+
+    def boom():
+        calls.append(1)
+        raise ConnectionError("down")
+
+    assert f.fetch_with_retry(boom, host="example", label="x", retries=2) is None
+    assert len(calls) == 3
+    assert f.fetch_report()["failures"] == [{"target": "x", "error": "down"}]
+
+
+def test_yfinance_keeps_its_own_session(monkeypatch):
+    # yfinance 的进程级会话使用 curl_cffi 浏览器指纹，不能被 requests.Session 覆盖
+    seen = []
+
+    def fake_download(*args, **kwargs):
+        seen.append(kwargs)
+        return pd.DataFrame()
+
+    monkeypatch.setattr(f.yf, "download", fake_download)
+    f.fetch_gvz_data(start_year=2025)
+    f.fetch_copper_curve_data(weeks=4)
+    assert seen and all("session" not in kwargs for kwargs in seen)
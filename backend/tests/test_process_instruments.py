@@ -0,0 +1,81 @@
+"""品种批量处理（按市场分组 + 进程池）测试"""
+
+import random
+
+import pandas as pd
+import pytest
+
+import cftc_data_fetcher as f
+
+
+COLUMNS = ['Open_Interest_All', 'M_Money_Positions_Long_All', 'M_Money_Positions_Short_All',
+           'M_Money_Positions_Spread_All', 'Prod_Merc_Positions_Long_All', 'Prod_Merc_Positions_Short_All',
+           'Other_Rept_Positions_Long_All', 'Other_Rept_Positions_Short_All']
+MARKETS = ["GOLD - COMMODITY EXCHANGE INC.", "SILVER - COMMODITY EXCHANGE INC.",
+           "COPPER- #1 - COMMODITY EXCHANGE INC.", "COPPER #2 - COMMODITY EXCHANGE INC.", None]
+
+
+@pytest.fixture
+def raw_df():
+    rng = random.Random(0)
+    rows = []
+    for i in range(600):
+        row = {"Market_and_Exchange_Names": MARKETS[i % len(MARKETS)],
+               "As_of_Date_In_Form_YYYY-MM-DD": (pd.Timestamp("2020-01-07")
+                                                 + pd.Timedelta(weeks=i // len(MARKETS))).strftime("%Y-%m-%d")}
+        row.update({c: rng.randint(0, 10 ** 6) for c in COLUMNS})
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def expected(raw_df, instruments):
+    out = []
+    for code, config in instruments.items():
+        sub = f.filter_commodity_data(raw_df, config['pattern'])
+        out.append(f.process_commodity_data(sub, weeks=52) if not sub.empty else None)
+    return out
+
+
+def test_sequential_matches_filter_path(raw_df):
+    results = f.process_instruments(raw_df, f.COMMODITIES, weeks=52, workers=1)
+    assert [r[0] for r in results] == list(f.COMMODITIES)
+    assert [r[1] for r in results] == expected(raw_df, f.COMMODITIES)
+    assert dict((r[0], r[3]) for r in results)["platinum"] == "未找到数据"
+
+
+def test_pool_matches_sequential(raw_df, monkeypatch):
+    monkeypatch.setattr(f, "PARALLEL_MIN_TASKS", 1)
+    parallel = f.process_instruments(raw_df, f.COMMODITIES, weeks=52, workers=2)
+    assert parallel == f.process_instruments(raw_df, f.COMMODITIES, weeks=52, workers=1)
+
+
+def test_broken_pool_falls_back_to_sequential(raw_df, monkeypatch):
+    class BrokenPool:
+        def __init__(self, *args, **kwargs):
+            raise OSError("no processes")
+
+    monkeypatch.setattr(f, "PARALLEL_MIN_TASKS", 1)
+    monkeypatch.setattr(f, "ProcessPoolExecutor", BrokenPool)
+    results = f.process_instruments(raw_df, f.COMMODITIES, weeks=52, workers=2)
+    assert [r[1] for r in results] == expected(raw_df, f.COMMODITIES)
+
+
+def test_bad_pattern_only_fails_that_instrument(raw_df):
+    instruments = {"gold": f.COMMODITIES["gold"], "broken": {"pattern": "(["}}
+    results = f.process_instruments(raw_df, instruments, weeks=52, workers=1)
+    assert results[0][1] == expected(raw_df, {"gold": f.COMMODITIES["gold"]})[0]
+    assert results[1][0] == "broken" and results[1][3].startswith("错误")
+
+
+def test_missing_market_column_reports_per_instrument(raw_df):
+    df = raw_df.rename(columns={"Market_and_Exchange_Names": "Name"})
+    results = f.process_instruments(df, f.COMMODITIES, weeks=52, workers=1)
+    assert len(results) == len(f.COMMODITIES)
+    assert all(r[1] is None and r[3].startswith("错误") for r in results)
+
+
+def test_invalid_worker_env_falls_back(monkeypatch):
+    monkeypatch.setenv("COT_WORKERS", "many")
+    assert f._worker_count() == 1
+    monkeypatch.setenv("COT_WORKERS", "3")
+    assert f._worker_count() == 3
@@ -0,0 +1,90 @@
+"""静态产物（内容哈希文件、增量文件、索引）测试"""
+
+import copy
+import gzip
+import json
+import os
+
+import pytest
+
+import cftc_data_fetcher as f
+
+
+def make_data(weeks=5, updated_at="2026-01-01 00:00:00"):
+    records = [{"date": f"2026-01-{i + 1:02d}", "mm_net": i} for i in range(weeks)]
+    return {
+        "commodities": {
+            "gold":   {"name": "黄金", "summary": {"mm_net": weeks - 1}, "weekly_data": records},
+            "silver": {"name": "白银", "summary": {}, "weekly_data": records[:2]},
+        },
+        "tff_instruments": {},
+        "gvz": [{"date": "2026-01-01", "close": 20.0}],
+        "updated_at": updated_at,
+    }
+
+
+def next_week(data, date="2026-01-31"):
+    new = copy.deepcopy(data)
+    weekly = new["commodities"]["gold"]["weekly_data"]
+    weekly.append({"date": date, "mm_net": 99})
+    weekly.pop(0)
+    new["commodities"].pop("silver", None)
+    new["gvz"] = []
+    new["updated_at"] = "2026-01-08 00:00:00"
+    return new
+
+
+@pytest.fixture
+def output_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(f, "OUTPUT_DIR", str(tmp_path))
+    return tmp_path
+
+
+def read_index(output_dir):
+    with open(os.path.join(output_dir, "cot_data.index.json"), encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def test_apply_delta_roundtrip():
+    old = make_data()
+    new = next_week(old)
+    delta = f.build_delta(old, new)
+    assert [r["date"] for r in delta["instruments"]["commodities"]["gold"]["weekly_upsert"]] == ["2026-01-31"]
+    assert delta["removed"]["commodities"] == ["silver"]
+    assert f.apply_delta(old, delta) == new
+
+
+def test_unchanged_content_keeps_file(output_dir):
+    data = make_data()
+    first = f.write_static_artifacts(data)
+    second = f.write_static_artifacts(make_data(updated_at="2026-01-02 00:00:00"))
+    assert first["file"] == second["file"]
+    assert second["updated_at"] == "2026-01-02 00:00:00"
+    with gzip.open(os.path.join(output_dir, first["file"] + ".gz"), "rt", encoding="utf-8") as fp:
+        assert json.load(fp) == data
+
+
+def test_new_version_publishes_delta_and_prunes(output_dir):
+    a = make_data()
+    b = next_week(a)
+    c = next_week(b, date="2026-02-07")
+    f.write_static_artifacts(a)
+    index_b = f.write_static_artifacts(b)
+    assert index_b["delta"]["base"] == f._artifact_hash(a)
+    assert index_b["delta"]["hash"] == index_b["hash"]
+
+    index_c = f.write_static_artifacts(c)
+    files = set(os.listdir(output_dir))
+    assert f"cot_data.{f._artifact_hash(a)}.json" not in files
+    assert {index_c["file"], index_c["previous"], index_c["delta"]["file"]} <= files
+
+
+def test_rollback_does_not_advertise_stale_delta(output_dir):
+    a = make_data()
+    b = next_week(a)
+    f.write_static_artifacts(a)
+    f.write_static_artifacts(b)
+    index = f.write_static_artifacts(a)
+    assert index["hash"] == f._artifact_hash(a)
+    assert index["delta"] is None or index["delta"]["hash"] == index["hash"]
+    assert read_index(output_dir) == index